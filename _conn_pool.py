@@ -0,0 +1,50 @@
+import logging
+import os
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = 'telemetry.db'
+
+# Opening a DuckDB connection re-runs extension bootstrap and re-parses the
+# database file header, which costs milliseconds per call. Reader scripts
+# amortize that with one long-lived read-only connection per process. The
+# writer deliberately does NOT hold a connection: DuckDB allows one read-write
+# process XOR many read-only processes on a database file, so the collector
+# opens a connection per batch flush and closes it again so the read-only
+# Streamlit app can attach in between (see README, "Database Concurrency").
+_reader_conn = None
+
+
+def open_writer_conn(db_file=DB_FILE):
+    """Opens a short-lived read-write DuckDB connection; the caller must close it.
+
+    Kept brief on purpose -- while it is open, the write lock keeps read-only
+    processes (the Streamlit app) from attaching to the database file.
+    """
+    conn = duckdb.connect(database=db_file, read_only=False)
+    # Checkpoint less often: the collector's small-batch INSERT pattern
+    # would otherwise trigger frequent WAL checkpoints (fsyncs).
+    conn.execute(
+        f"PRAGMA threads={os.cpu_count() or 4}; "
+        "PRAGMA memory_limit='512MB'; "
+        "PRAGMA checkpoint_threshold='64MB'"
+    )
+    return conn
+
+
+def get_reader_conn(db_file=DB_FILE):
+    """Returns the process-wide read-only DuckDB connection, opening it on first use."""
+    global _reader_conn
+    if _reader_conn is None:
+        _reader_conn = duckdb.connect(database=db_file, read_only=True)
+        # Parallelize scans across cores, cap memory, and keep the object
+        # cache warm so repeated polls reuse parsed metadata.
+        _reader_conn.execute(
+            f"PRAGMA threads={os.cpu_count() or 4}; "
+            "PRAGMA memory_limit='512MB'; "
+            "PRAGMA enable_object_cache=true"
+        )
+        logger.info(f"Opened shared read-only DuckDB connection to {db_file}")
+    return _reader_conn
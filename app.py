@@ -2,7 +2,11 @@ import streamlit as st
 import duckdb
 import logging
 import datetime
+import asyncio
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
 
 # --- Logging Setup ---
@@ -13,14 +17,14 @@ logger = logging.getLogger(__name__)
 
 # Try to import from langchain_ollama first (recommended), but fall back to langchain_community if not available
 try:
-    from langchain_ollama import Ollama as OllamaLLM
+    from langchain_ollama import ChatOllama
     logger.info("Using langchain_ollama package for Ollama integration")
 except ImportError:
     # Fall back to the older import method
-    from langchain_community.llms import Ollama as OllamaLLM
+    from langchain_community.chat_models import ChatOllama
     logger.info("Using langchain_community package for Ollama integration (legacy)")
 
-from langchain_core.prompts import PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableSequence
 
@@ -31,11 +35,17 @@ TABLE_NAME = 'system_metrics' # Must match telemetry_collector.py
 OLLAMA_MODEL = 'llama2:7b' # Make sure this model is pulled in Ollama
 
 # --- LLM and LangChain Setup ---
-try:
+@st.cache_resource # Reuse the LLM client (and its HTTP connection pool) across reruns
+def get_llm():
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    # Update to use the new OllamaLLM class from langchain_ollama
-    llm = OllamaLLM(model=OLLAMA_MODEL, base_url=ollama_base_url)
-    logger.info(f"Ollama LLM initialized with model {OLLAMA_MODEL} at {ollama_base_url}")
+    # Chat-style requests put the static instructions in a system message, so
+    # Ollama only has to prefill the short per-turn user delta; keep_alive=-1
+    # pins the model (and its prompt/KV cache) between calls and across turns.
+    return ChatOllama(model=OLLAMA_MODEL, base_url=ollama_base_url, keep_alive=-1)
+
+try:
+    llm = get_llm()
+    logger.info(f"Ollama LLM initialized with model {OLLAMA_MODEL}")
 except Exception as e:
     logger.error(f"Failed to initialize Ollama LLM: {e}")
     st.error(f"Failed to initialize Ollama LLM: {e}. Ensure Ollama is running and the model '{OLLAMA_MODEL}' is available.")
@@ -49,6 +59,14 @@ def get_db_connection():
         # Use only read_only=True without access_mode parameter 
         # This works across different DuckDB versions
         conn = duckdb.connect(database=DB_FILE, read_only=True)
+        # Parallelize timestamp-range scans across cores, cap memory so
+        # Streamlit rerun churn can't OOM a small VM, and keep the object
+        # cache warm across reruns.
+        conn.execute(
+            f"PRAGMA threads={os.cpu_count() or 4}; "
+            "PRAGMA memory_limit='512MB'; "
+            "PRAGMA enable_object_cache=true"
+        )
         logger.info(f"Successfully connected to DuckDB database: {DB_FILE}")
         return conn
     except Exception as e:
@@ -57,21 +75,44 @@ def get_db_connection():
         return None
 
 def execute_query(conn, query):
-    """Executes a SQL query and returns the results."""
+    """Executes a SQL query and returns the results as a pyarrow Table.
+
+    Arrow keeps the result in a columnar buffer that st.dataframe renders
+    directly and pandas formats at C level, instead of materializing a
+    Python tuple per row.
+    """
     if conn is None:
         return None, "Database connection not available."
     try:
         logger.info(f"Executing SQL query: {query}")
-        results = conn.execute(query).fetchall()
-        logger.info(f"Query results count: {len(results)}")
-        # For large results, log only a summary or first few
-        if results:
-            logger.debug(f"First result row: {results[0]}")
+        results = conn.execute(query).fetch_arrow_table()
+        logger.info(f"Query results count: {results.num_rows}")
         return results, None
     except Exception as e:
         logger.error(f"Error executing SQL query '{query}': {e}")
         return None, f"Error executing SQL query: {e}"
 
+MAX_RESULT_ROWS = 200
+_SQL_LIMIT_RE = re.compile(r"\blimit\b", re.IGNORECASE)
+# Markdown fences and 'SQL Query:' labels the LLM sometimes wraps around its
+# output, stripped in a single pass instead of chained str.replace walks
+_SQL_CLEANUP_RE = re.compile(r"```(?:sql)?|^\s*sql query:\s*", re.IGNORECASE | re.MULTILINE)
+
+def bound_query(sql):
+    """Wraps generated SQL in a LIMIT unless it already has one.
+
+    DuckDB pushes the LIMIT into the scan, so rows beyond the bound are never
+    materialized; only the first 20 reach the summarizer prompt anyway.
+    Returns (bounded_sql, count_sql) where count_sql recovers the true row
+    count for the '... and N more rows' hint, or None if no bound was added.
+    """
+    sql = sql.strip().rstrip(";")
+    if _SQL_LIMIT_RE.search(sql):
+        return sql, None
+    return (f"SELECT * FROM ({sql}) LIMIT {MAX_RESULT_ROWS}",
+            f"SELECT COUNT(*) FROM ({sql})")
+
+
 def show_database():
     conn = get_db_connection()
     if conn is None:
@@ -84,41 +125,41 @@ def show_database():
     
     if schema_error:
         st.error(f"Error fetching schema: {schema_error}")
-    elif schema_results:
+    elif schema_results is not None:
         st.dataframe(schema_results)
-    
+
     st.subheader("Sample Data")
     sample_query = f"SELECT * FROM {TABLE_NAME} ORDER BY timestamp DESC LIMIT 10"
     sample_results, sample_error = execute_query(conn, sample_query)
-    
+
     if sample_error:
         st.error(f"Error fetching sample data: {sample_error}")
-    elif sample_results:
+    elif sample_results is not None and sample_results.num_rows > 0:
         st.dataframe(sample_results)
     else:
         st.info("No data available in the database.")
-    
+
     st.subheader("Database Statistics")
     stats_query = f"SELECT COUNT(*) as total_records FROM {TABLE_NAME}"
     stats_results, stats_error = execute_query(conn, stats_query)
-    
+
     if stats_error:
         st.error(f"Error fetching statistics: {stats_error}")
-    elif stats_results:
-        st.metric("Total Records", stats_results[0][0])
-        
+    elif stats_results is not None:
+        st.metric("Total Records", stats_results.column(0)[0].as_py())
+
     time_range_query = f"SELECT MIN(timestamp) as first_record, MAX(timestamp) as last_record FROM {TABLE_NAME}"
     time_results, time_error = execute_query(conn, time_range_query)
-    
-    if not time_error and time_results and time_results[0][0] is not None:
+
+    if not time_error and time_results is not None and time_results.column(0)[0].as_py() is not None:
         col1, col2 = st.columns(2)
         with col1:
             # Convert datetime to string before passing to metric
-            first_record_str = str(time_results[0][0])
+            first_record_str = str(time_results.column(0)[0].as_py())
             st.metric("First Record", first_record_str)
         with col2:
             # Convert datetime to string before passing to metric
-            last_record_str = str(time_results[0][1])
+            last_record_str = str(time_results.column(1)[0].as_py())
             st.metric("Last Record", last_record_str)
 
 # --- Prompt Templates ---
@@ -148,10 +189,15 @@ Guidelines for SQL generation:
    - "disk" or "disk usage" -> `disk_usage`
 4. For threshold queries (e.g., "memory usage > 65%"), use the correct column and comparison operator.
    The metric values are percentages, so if the user says "65%", use `65` in the SQL.
-5. SELECT all columns (`SELECT *`) or specific relevant columns like `hostname, timestamp, cpu_usage` etc.
+5. Prefer selecting the specific relevant columns (e.g. `hostname, timestamp, cpu_usage`) over `SELECT *`.
    If the query asks for "servers" or "hosts", ensure `hostname` is selected.
 6. If the query asks for a list or specific instances, `SELECT DISTINCT hostname, timestamp, <metric_column>` is often appropriate.
 7. If the query asks "Did any service spike...", you might want to use `COUNT(*)` or select specific instances.
+8. Do arithmetic and formatting in SQL rather than leaving raw values:
+   - Round percentages for display: `ROUND(cpu_usage, 1) AS cpu_usage`
+   - Bucket timestamps when exact microseconds don't matter: `date_trunc('minute', timestamp) AS ts`
+   - For "which servers..." questions, aggregate to one row per host instead of listing every sample:
+     `SELECT hostname, ROUND(MAX(memory_usage), 1) AS peak_memory, COUNT(*) AS samples ... GROUP BY hostname`
 
 Example Natural Language Query: "Show me servers that crossed 65% memory usage in the past 24 hours."
 Example SQL Output: SELECT DISTINCT hostname, timestamp, memory_usage FROM {TABLE_NAME} WHERE memory_usage > 65 AND timestamp >= NOW() - INTERVAL '24 hours' ORDER BY timestamp DESC;
@@ -162,45 +208,58 @@ Example SQL Output: SELECT hostname, timestamp, cpu_usage FROM {TABLE_NAME} WHER
 Example Natural Language Query: "List hosts with >90% disk usage in the past 12 hours"
 Example SQL Output: SELECT DISTINCT hostname, timestamp, disk_usage FROM {TABLE_NAME} WHERE disk_usage > 90 AND timestamp >= NOW() - INTERVAL '12 hours' ORDER BY hostname, timestamp DESC;
 
+Example Natural Language Query: "Which servers ran hot on CPU in the last 24 hours?"
+Example SQL Output: SELECT hostname, ROUND(MAX(cpu_usage), 1) AS peak_cpu, COUNT(*) AS samples_over_80 FROM {TABLE_NAME} WHERE cpu_usage > 80 AND timestamp >= NOW() - INTERVAL '24 hours' GROUP BY hostname ORDER BY peak_cpu DESC;
+
 Only output the SQL query. Do not add any other text, explanation, or markdown formatting.
 """
 
-nl_to_sql_prompt_template = PromptTemplate(
-    input_variables=["natural_language_query", "schema_guidance"],
-    template="""{schema_guidance}
-
-Natural Language Query: {natural_language_query}
-SQL Query:"""
-)
-
-summarize_results_prompt_template = PromptTemplate(
-    input_variables=["natural_language_query", "sql_query", "sql_results"],
-    template="""You are an AI assistant that summarizes database query results in a human-readable way.
-Original Natural Language Query: {natural_language_query}
-Generated SQL Query: {sql_query}
-SQL Query Results:
-{sql_results}
-
+# The static guidance goes into the system message so Ollama can serve it from
+# its prompt/KV cache; only the short human message changes per turn. It is
+# partialed in once at module load, so invocations carry only the query and
+# nothing re-threads the ~1KB guidance string through the chain per call.
+nl_to_sql_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", "{schema_guidance}"),
+    ("human", """Natural Language Query: {natural_language_query}
+SQL Query:""")
+]).partial(schema_guidance=SCHEMA_GUIDANCE)
+
+nl_to_sql_batch_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", "{schema_guidance}"),
+    ("human", """You are given {n} independent natural language queries, numbered Q1 to Q{n}:
+{queries}
+
+Return exactly {n} lines, one per query, each of the form:
+SQL[i]: <the SQL query for Qi>
+
+Do not add any other text, explanation, or markdown formatting.""")
+]).partial(schema_guidance=SCHEMA_GUIDANCE)
+
+summarize_results_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", """You are an AI assistant that summarizes database query results in a human-readable way.
 Based on the query and results, provide a concise, natural language summary.
 If the results are empty, state that no data matched the criteria.
 If there are many results, summarize the key findings rather than listing everything.
 Focus on answering the original question.
 For example, if the query was "Which servers had >65% memory usage?", your summary could be:
 "The following servers had memory usage over 65% in the specified period: server-A (70% at YYYY-MM-DD HH:MM), server-B (80% at YYYY-MM-DD HH:MM)."
-Or, if no data: "No servers were found with memory usage over 65% in the specified period."
+Or, if no data: "No servers were found with memory usage over 65% in the specified period." """),
+    ("human", """Original Natural Language Query: {natural_language_query}
+Generated SQL Query: {sql_query}
+SQL Query Results:
+{sql_results}
 
-Summary:"""
-)
+Summary:""")
+])
 
 # --- LangChain Chains ---
 # Replace from_components with the correct syntax for RunnableSequence
 sql_generation_chain = (
     {
-        "natural_language_query": lambda x: x["natural_language_query"], 
-        "schema_guidance": lambda x: x["schema_guidance"]
-    } 
-    | nl_to_sql_prompt_template 
-    | llm 
+        "natural_language_query": lambda x: x["natural_language_query"]
+    }
+    | nl_to_sql_prompt_template
+    | llm
     | StrOutputParser()
 )
 
@@ -210,11 +269,160 @@ summarization_chain = (
         "sql_query": lambda x: x["sql_query"],
         "sql_results": lambda x: x["sql_results"]
     } 
-    | summarize_results_prompt_template 
-    | llm 
+    | summarize_results_prompt_template
+    | llm
     | StrOutputParser()
 )
 
+sql_batch_generation_chain = (
+    {
+        "queries": lambda x: x["queries"],
+        "n": lambda x: x["n"]
+    }
+    | nl_to_sql_batch_prompt_template
+    | llm
+    | StrOutputParser()
+)
+
+
+# --- Batched SQL generation ---
+_BATCH_SQL_LINE_RE = re.compile(r"^\s*SQL\[(\d+)\]:\s*(.*)$")
+
+def _parse_batch_sql(response, n):
+    """Parses 'SQL[i]: ...' lines from a batched response into an n-element list.
+
+    Returns None if the response does not cover all n queries, so the caller
+    can fall back to single-shot generation.
+    """
+    results = [None] * n
+    current = None
+    for line in response.splitlines():
+        match = _BATCH_SQL_LINE_RE.match(line)
+        if match:
+            index = int(match.group(1)) - 1
+            if 0 <= index < n:
+                current = index
+                results[index] = match.group(2).strip()
+        elif current is not None and line.strip():
+            # Continuation of a multi-line SQL statement
+            results[current] += " " + line.strip()
+    if any(r is None for r in results):
+        return None
+    return results
+
+
+class _PendingSqlRequest:
+    __slots__ = ("query", "event", "result", "error")
+
+    def __init__(self, query):
+        self.query = query
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SqlRequestBatcher:
+    """Coalesces concurrent NL->SQL requests into one batched LLM prompt.
+
+    Each Streamlit session runs in its own thread; the first thread to arrive
+    becomes the batch leader, waits briefly for others, then issues a single
+    prompt covering the whole batch. This amortizes the SCHEMA_GUIDANCE
+    preamble (the bulk of the prompt tokens) once per batch instead of once
+    per query. A lone request stops waiting after a short solo window and
+    falls through to the normal single-shot chain, so the single-user path
+    pays a few tens of milliseconds at most -- small against multi-second
+    generation, but not free.
+    """
+    MAX_BATCH_SIZE = 6
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def generate(self, user_query, timeout_ms=200, solo_timeout_ms=50):
+        entry = _PendingSqlRequest(user_query)
+        with self._lock:
+            is_leader = not self._pending
+            self._pending.append(entry)
+        if is_leader:
+            now = time.monotonic()
+            deadline = now + timeout_ms / 1000.0
+            # A lone request gives up waiting much sooner: the full window is
+            # only worth spending once a second session has actually joined,
+            # so the single-user path pays at most solo_timeout_ms extra.
+            solo_deadline = now + solo_timeout_ms / 1000.0
+            while time.monotonic() < deadline:
+                with self._lock:
+                    pending_count = len(self._pending)
+                if pending_count >= self.MAX_BATCH_SIZE:
+                    break
+                if pending_count == 1 and time.monotonic() >= solo_deadline:
+                    break
+                time.sleep(0.01)
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+            self._flush(batch)
+        entry.event.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _flush(self, batch):
+        try:
+            if len(batch) >= 2:
+                queries = "\n".join(f"Q{i + 1}: {e.query}" for i, e in enumerate(batch))
+                logger.info(f"Flushing batched SQL generation for {len(batch)} queries")
+                response = asyncio.run(sql_batch_generation_chain.ainvoke({
+                    "queries": queries, "n": len(batch)
+                }))
+                parsed = _parse_batch_sql(response, len(batch))
+                if parsed is not None:
+                    for entry, sql in zip(batch, parsed):
+                        entry.result = sql
+                    return
+                logger.warning("Batched SQL response was malformed; falling back to single-shot generation")
+
+            async def _generate_all():
+                return await asyncio.gather(*(
+                    sql_generation_chain.ainvoke({"natural_language_query": entry.query})
+                    for entry in batch
+                ))
+
+            # One event loop for the whole fallback: the calls stay in flight
+            # together (filling Ollama's parallel slots) and share the client's
+            # async HTTP pool, instead of each asyncio.run building and tearing
+            # down its own loop for a serialized call.
+            for entry, sql in zip(batch, asyncio.run(_generate_all())):
+                entry.result = sql
+        except Exception as exc:
+            for entry in batch:
+                entry.error = exc
+        finally:
+            for entry in batch:
+                entry.event.set()
+
+
+@st.cache_resource # One batcher shared by all sessions in this process
+def get_sql_batcher():
+    return SqlRequestBatcher()
+
+
+def normalize_query(user_query):
+    """Lowercases and collapses whitespace so trivially-different phrasings share a cache entry."""
+    return re.sub(r"\s+", " ", user_query.strip().lower())
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def nl_to_sql_cached(q_norm: str, _user_query: str) -> str:
+    # The schema is fixed, so the normalized query alone is a sufficient cache
+    # key (the underscore prefix excludes _user_query from the key); a hit
+    # skips the LLM entirely. The LLM sees the user's original text, since
+    # lowercasing it would break case-sensitive literals like hostnames.
+    # Only the SQL string is cached here -- never the DuckDB connection or a
+    # result cursor, which don't pickle.
+    return get_sql_batcher().generate(_user_query)
+
 
 # --- Streamlit UI ---
 st.set_page_config(layout="wide", page_title="Observability Assistant")
@@ -271,10 +479,12 @@ if user_query:
             with st.spinner("Generating SQL query..."):
                 logger.info("Attempting to generate SQL query...")
                 # Provide schema guidance dynamically to the chain
-                sql_generation_input = {"natural_language_query": user_query, "schema_guidance": SCHEMA_GUIDANCE}
-                generated_sql = sql_generation_chain.invoke(sql_generation_input)
-                # Basic cleaning: remove potential markdown backticks if LLM adds them
-                generated_sql = generated_sql.strip().replace("```sql", "").replace("```", "").strip()
+                # Repeated questions hit the st.cache_data layer and skip the
+                # LLM; misses go to the batcher, which coalesces concurrent
+                # sessions' queries into one prompt.
+                generated_sql = nl_to_sql_cached(normalize_query(user_query), user_query)
+                # Basic cleaning: remove markdown fences/labels if the LLM adds them
+                generated_sql = _SQL_CLEANUP_RE.sub("", generated_sql).strip()
                 logger.info(f"Generated SQL: {generated_sql}")
                 message_placeholder.markdown(thinking_message + f"\n\n🔍 Generated SQL:\n```sql\n{generated_sql}\n```")
 
@@ -282,47 +492,51 @@ if user_query:
             # 2. Execute SQL Query
             with st.spinner("Executing SQL query on DuckDB..."):
                 logger.info("Attempting to execute SQL query...")
-                # Convert to DataFrame for better display and potential summarization inputs
-                results_list, db_error = execute_query(conn, generated_sql)
+                bounded_sql, count_sql = bound_query(generated_sql)
+                results_table, db_error = execute_query(conn, bounded_sql)
                 if db_error:
                     error_in_processing = f"Database error: {db_error}"
                     logger.error(error_in_processing)
-                elif results_list is not None:
-                    # Convert list of tuples to a more structured format for the LLM if needed,
-                    # or pass as string. For now, converting to string for the prompt.
-                    if results_list:
-                        # Get column names from the cursor description if available
-                        # This is a bit tricky as execute_query only returns fetchall()
-                        # A more robust way would be to get cursor.description after execution
-                        # For simplicity, we'll format it as a list of tuples string.
-                        sql_results_str = "\n".join([str(row) for row in results_list[:20]]) # Limit for prompt
-                        if len(results_list) > 20:
-                            sql_results_str += f"\n... and {len(results_list) - 20} more rows."
+                elif results_table is not None:
+                    if results_table.num_rows > 0:
+                        total_rows = results_table.num_rows
+                        if count_sql is not None and results_table.num_rows == MAX_RESULT_ROWS:
+                            # Bound was likely hit; recover the true count for the hint
+                            count_table, count_error = execute_query(conn, count_sql)
+                            if not count_error:
+                                total_rows = count_table.column(0)[0].as_py()
+                        # CSV with a header row: built at C level by pandas, and
+                        # denser in tokens than padded columns or tuple reprs.
+                        sql_results_str = results_table.slice(0, 20).to_pandas().to_csv(index=False).strip()
+                        if total_rows > 20:
+                            sql_results_str += f"\n... and {total_rows - 20} more rows."
                         logger.info(f"SQL results (first 20 rows or less): {sql_results_str}")
-                        sql_results = results_list # Store the raw list for potential display
+                        sql_results = results_table # Arrow table renders directly in st.dataframe
                     else:
                         sql_results_str = "No results found."
                         logger.info("SQL query returned no results.")
-                        sql_results = [] # Store empty list
+                        sql_results = results_table # Empty table, still displayable
 
             # 3. Summarize Results with LLM
             if not error_in_processing:
-                with st.spinner("Summarizing results..."):
-                    logger.info("Attempting to summarize results...")
-                    summarization_input = {
-                        "natural_language_query": user_query,
-                        "sql_query": generated_sql,
-                        "sql_results": sql_results_str
-                    }
-                    summary = summarization_chain.invoke(summarization_input)
-                    logger.info(f"LLM Summary: {summary}")
-                    message_placeholder.markdown(summary)
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": summary,
-                        "sql": generated_sql,
-                        "raw_results": sql_results
-                    })
+                logger.info("Attempting to summarize results...")
+                summarization_input = {
+                    "natural_language_query": user_query,
+                    "sql_query": generated_sql,
+                    "sql_results": sql_results_str
+                }
+                # Stream tokens into the chat as they are generated: total time
+                # is unchanged, but perceived latency drops to first-token time
+                # instead of the full generation.
+                message_placeholder.empty()
+                summary = st.write_stream(summarization_chain.stream(summarization_input))
+                logger.info(f"LLM Summary: {summary}")
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": summary,
+                    "sql": generated_sql,
+                    "raw_results": sql_results
+                })
             else: # Handle error from SQL generation or execution
                 message_placeholder.error(error_in_processing)
                 st.session_state.messages.append({
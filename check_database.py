@@ -1,7 +1,8 @@
 import os
-import duckdb
 import logging
 
+from _conn_pool import get_reader_conn
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -14,24 +15,28 @@ def check_database():
         return False
     
     try:
-        conn = duckdb.connect(database=DB_FILE, read_only=True)
-        
-        result = conn.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{TABLE_NAME}'").fetchone()
-        if not result:
+        conn = get_reader_conn(DB_FILE)
+
+        # Metadata-only catalog lookup with a bound parameter, instead of
+        # listing every table and filtering in Python.
+        exists = conn.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = ?", [TABLE_NAME]
+        ).fetchone()
+        if not exists:
             logger.warning(f"Table '{TABLE_NAME}' does not exist in the database! Please run telemetry_collector.py first.")
-            conn.close()
             return False
-        
-        count = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+
+        # One round trip for count and time range instead of three fetchones
+        count, first_ts, last_ts = conn.execute(
+            f"SELECT (SELECT COUNT(*) FROM {TABLE_NAME}), MIN(timestamp), MAX(timestamp) FROM {TABLE_NAME}"
+        ).fetchone()
         if count == 0:
             logger.warning(f"No data in table '{TABLE_NAME}'! Please run telemetry_collector.py for a few minutes to collect data.")
-            conn.close()
             return False
-        
-        logger.info(f"Database check successful: {count} records found in {TABLE_NAME}")
-        conn.close()
+
+        logger.info(f"Database check successful: {count} records found in {TABLE_NAME} ({first_ts} to {last_ts})")
         return True
-        
+
     except Exception as e:
         logger.error(f"Error checking database: {e}")
         return False
@@ -42,19 +47,27 @@ def show_database():
         return None
     
     try:
-        conn = duckdb.connect(database=DB_FILE, read_only=True)
-        
-        schema_info = conn.execute(f"DESCRIBE {TABLE_NAME}").fetchall()
-        sample_data = conn.execute(f"SELECT * FROM {TABLE_NAME} ORDER BY timestamp DESC LIMIT 10").fetchall()
-        record_count = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
-        time_range = conn.execute(f"SELECT MIN(timestamp) as first_record, MAX(timestamp) as last_record FROM {TABLE_NAME}").fetchone()
-        
-        conn.close()
-        
+        conn = get_reader_conn(DB_FILE)
+
+        # Schema comes from catalog metadata (no table scan), and the count,
+        # time range and sample rows come back in one query/one scan instead
+        # of four separate round trips.
+        rel = conn.table(TABLE_NAME)
+        schema_info = list(zip(rel.columns, [str(t) for t in rel.types]))
+
+        record_count, first_ts, last_ts, sample_rows = conn.execute(f"""
+            WITH s AS (SELECT * FROM {TABLE_NAME} ORDER BY timestamp DESC LIMIT 10)
+            SELECT (SELECT COUNT(*) FROM {TABLE_NAME}),
+                   (SELECT MIN(timestamp) FROM {TABLE_NAME}),
+                   (SELECT MAX(timestamp) FROM {TABLE_NAME}),
+                   (SELECT COALESCE(LIST(s), []) FROM s)
+        """).fetchone()
+        sample_data = [tuple(row.values()) for row in sample_rows]
+
         # Convert datetime objects to strings
-        first_record = str(time_range[0]) if time_range[0] is not None else None
-        last_record = str(time_range[1]) if time_range[1] is not None else None
-        
+        first_record = str(first_ts) if first_ts is not None else None
+        last_record = str(last_ts) if last_ts is not None else None
+
         return {
             "schema": schema_info,
             "sample_data": sample_data,
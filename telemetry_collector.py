@@ -1,16 +1,30 @@
 import duckdb
 import psutil
+import pyarrow as pa
 import time
 import datetime
+import signal
 import socket
 import logging
 import os
+from collections import deque
+
+from _conn_pool import open_writer_conn
 
 DB_FILE = 'telemetry.db'
 TABLE_NAME = 'system_metrics'
 COLLECTION_INTERVAL_SECONDS = 10
+FLUSH_INTERVAL_SECONDS = 60
+FLUSH_MAX_ROWS = 60
 HOSTNAME = socket.gethostname()
 
+# Samples are buffered here and written in batches so the parse/plan/commit
+# cost of an INSERT is amortized over many rows instead of paid per sample.
+_metrics_buffer = deque()
+
+# Hoisted so the per-sample hot path skips two attribute lookups
+_now = datetime.datetime.now
+
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s',
                     handlers=[logging.StreamHandler()])
@@ -28,13 +42,19 @@ def create_table_if_not_exists(conn):
                 UNIQUE(timestamp, hostname)
             )
         """)
+        # Every generated query filters on a timestamp range; the index lets
+        # DuckDB prune to the matching rows instead of scanning all history.
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ts_idx ON {TABLE_NAME}(timestamp)")
         logger.info(f"Table '{TABLE_NAME}' ensured to exist.")
     except Exception as e:
         logger.error(f"Error creating table: {e}")
         raise
 
 def get_system_metrics():
-    cpu = psutil.cpu_percent(interval=1)
+    # interval=None returns the CPU delta since the previous call instead of
+    # blocking for a 1s sample window; the collection loop's own sleep
+    # provides the sampling interval.
+    cpu = psutil.cpu_percent(interval=None)
     memory = psutil.virtual_memory().percent
     try:
         disk = psutil.disk_usage('/').percent
@@ -43,54 +63,114 @@ def get_system_metrics():
         disk = 0.0
 
     return {
-        "timestamp": datetime.datetime.now(),
+        "timestamp": _now(),
         "hostname": HOSTNAME,
         "cpu_usage": cpu,
         "memory_usage": memory,
         "disk_usage": disk
     }
 
-def store_metrics(conn, metrics):
+def store_metrics(metrics):
+    """Buffers a sample, flushing to DuckDB once the buffer is full."""
+    _metrics_buffer.append(metrics)
+    logger.info(f"Buffered metrics: CPU={metrics['cpu_usage']:.2f}%, "
+                f"Mem={metrics['memory_usage']:.2f}%, Disk={metrics['disk_usage']:.2f}%")
+    if len(_metrics_buffer) >= FLUSH_MAX_ROWS:
+        flush_metrics()
+
+def flush_metrics():
+    """Writes all buffered samples into the table in one batched append.
+
+    The write connection is opened for the flush and closed right after:
+    DuckDB allows one read-write process XOR many read-only processes on a
+    database file, so holding the write lock between flushes would lock the
+    read-only Streamlit app out (see README, "Database Concurrency").
+
+    conn.append() hands DuckDB the whole batch as a columnar buffer and skips
+    the SQL parse/bind step entirely. Duplicate (timestamp, hostname) pairs
+    can't normally occur within one process, but if the UNIQUE constraint does
+    fire the batch is retried through INSERT OR IGNORE, which keeps the dedup
+    semantics the old per-row path got from catching ConstraintException.
+    """
+    if not _metrics_buffer:
+        return
+    rows = list(_metrics_buffer)
+    _metrics_buffer.clear()
+    buf = pa.Table.from_pylist(rows)
+    conn = None
     try:
-        conn.execute(
-            f"INSERT INTO {TABLE_NAME} (timestamp, hostname, cpu_usage, memory_usage, disk_usage) VALUES (?, ?, ?, ?, ?)",
-            (metrics["timestamp"], metrics["hostname"], metrics["cpu_usage"], metrics["memory_usage"], metrics["disk_usage"])
-        )
-        logger.info(f"Stored metrics: CPU={metrics['cpu_usage']:.2f}%, "
-                    f"Mem={metrics['memory_usage']:.2f}%, Disk={metrics['disk_usage']:.2f}%")
+        conn = open_writer_conn(DB_FILE)
+        create_table_if_not_exists(conn)
+        conn.append(TABLE_NAME, buf.to_pandas())
+        logger.info(f"Flushed {len(rows)} buffered samples to {TABLE_NAME}")
     except duckdb.ConstraintException:
-        logger.warning(f"Duplicate entry for timestamp {metrics['timestamp']} and host {metrics['hostname']}. Skipping.")
+        logger.warning("Duplicate entries in flush batch; retrying with INSERT OR IGNORE.")
+        try:
+            conn.register("metrics_buf", buf)
+            conn.execute(
+                f"INSERT OR IGNORE INTO {TABLE_NAME} (timestamp, hostname, cpu_usage, memory_usage, disk_usage) "
+                f"SELECT timestamp, hostname, cpu_usage, memory_usage, disk_usage FROM metrics_buf"
+            )
+            conn.unregister("metrics_buf")
+            logger.info(f"Flushed {len(rows)} buffered samples to {TABLE_NAME} (duplicates skipped)")
+        except Exception as e:
+            _rebuffer(rows)
+            logger.error(f"Error flushing {len(rows)} buffered samples, kept in buffer: {e}")
     except Exception as e:
-        logger.error(f"Error storing metrics: {e}")
+        # A transient failure (e.g. a reader briefly holding the file lock)
+        # must not lose the batch; put it back and retry on the next cycle.
+        _rebuffer(rows)
+        logger.error(f"Error flushing {len(rows)} buffered samples, kept in buffer: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def _rebuffer(rows):
+    """Puts a failed flush batch back at the front of the buffer, in order."""
+    _metrics_buffer.extendleft(reversed(rows))
+
+def _handle_sigterm(signum, frame):
+    # systemd/docker stop sends SIGTERM; exit through the normal shutdown path
+    # (SystemExit is not caught by the loop's except Exception) so the
+    # buffered remainder still gets flushed.
+    raise SystemExit(0)
 
 def main():
     logger.info("Starting telemetry collector...")
-    while True:
-        conn = None
-        try:
-            conn = duckdb.connect(database=DB_FILE, read_only=False)
-            create_table_if_not_exists(conn)
-            
-            metrics = get_system_metrics()
-            store_metrics(conn, metrics)
-            
-            conn.close()
-            conn = None
-            logger.debug("Connection closed after writing metrics")
-            
-            time.sleep(COLLECTION_INTERVAL_SECONDS)
-
-        except KeyboardInterrupt:
-            logger.info("Telemetry collector stopped by user.")
-            break
-        except Exception as e:
-            logger.error(f"Unhandled exception in telemetry collector: {e}", exc_info=True)
-        finally:
-            if conn:
-                conn.close()
-                logger.info("DuckDB connection closed.")
-                
-    logger.info("Telemetry collector shutdown complete.")
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    # Seed psutil's internal CPU counters so the first interval=None reading
+    # in the loop has a meaningful baseline.
+    psutil.cpu_percent(interval=None)
+    last_flush = time.monotonic()
+    # Schedule samples against absolute monotonic deadlines: the work done in
+    # each cycle no longer stretches the cadence, so the timestamp grid stays
+    # on a tight COLLECTION_INTERVAL_SECONDS spacing.
+    deadline = time.monotonic()
+    try:
+        while True:
+            try:
+                metrics = get_system_metrics()
+                store_metrics(metrics)
+
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL_SECONDS:
+                    flush_metrics()
+                    last_flush = time.monotonic()
+
+                deadline += COLLECTION_INTERVAL_SECONDS
+                time.sleep(max(0.0, deadline - time.monotonic()))
+
+            except KeyboardInterrupt:
+                logger.info("Telemetry collector stopped by user.")
+                break
+            except Exception as e:
+                logger.error(f"Unhandled exception in telemetry collector: {e}", exc_info=True)
+                # Drop any ticks missed during the outage instead of firing
+                # them back-to-back with zero sleep to catch up.
+                deadline = max(deadline, time.monotonic())
+    finally:
+        # Flush the partial batch on any exit path, including SIGTERM
+        flush_metrics()
+        logger.info("Telemetry collector shutdown complete.")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,120 @@
+import duckdb
+import logging
+import multiprocessing
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DB_FILE = 'telemetry.db'
+TABLE_NAME = 'system_metrics'
+TEST_HOSTNAME = 'test-server'
+
+
+def writer_process(rows_written, release):
+    """Writes a batch of test rows, then holds the write lock open until released.
+
+    The open connection is the point: DuckDB allows one read-write process XOR
+    many read-only processes on a file, and the collector relies on that by
+    keeping its write windows brief. This process stands in for a writer that
+    is mid-flush.
+    """
+    conn = duckdb.connect(database=DB_FILE, read_only=False)
+    try:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                timestamp TIMESTAMP,
+                hostname VARCHAR,
+                cpu_usage FLOAT,
+                memory_usage FLOAT,
+                disk_usage FLOAT,
+                UNIQUE(timestamp, hostname)
+            )
+        """)
+        # One parameterized statement bound over the whole batch: DuckDB plans
+        # it once instead of re-parsing five interpolated INSERT strings.
+        rows = [(f"2025-05-07 18:{i}0:00", TEST_HOSTNAME, 60.0 + i, 50.0, 40.0)
+                for i in range(5)]
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {TABLE_NAME} (timestamp, hostname, cpu_usage, memory_usage, disk_usage) "
+            f"VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        logger.info(f"Writer inserted {len(rows)} test rows for host '{TEST_HOSTNAME}', holding the lock...")
+        rows_written.set()
+        release.wait(timeout=30)
+    finally:
+        conn.close()
+
+
+def reader_process(result_queue):
+    """Tries to read as a Streamlit session would: read-only connection, count rows.
+
+    Reports 'locked' if the connect is refused because a writer holds the file.
+    """
+    try:
+        conn = duckdb.connect(database=DB_FILE, read_only=True)
+    except duckdb.IOException:
+        result_queue.put("locked")
+        return
+    try:
+        count = conn.execute(
+            f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE hostname = ?", [TEST_HOSTNAME]
+        ).fetchone()[0]
+        result_queue.put(count)
+    finally:
+        conn.close()
+
+
+def run_readers(count=3):
+    result_queue = multiprocessing.Queue()
+    readers = [multiprocessing.Process(target=reader_process, args=(result_queue,))
+               for _ in range(count)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    return [result_queue.get() for _ in readers]
+
+
+def cleanup():
+    """Removes the test rows so real telemetry stays untouched."""
+    conn = duckdb.connect(database=DB_FILE, read_only=False)
+    try:
+        conn.execute(f"DELETE FROM {TABLE_NAME} WHERE hostname = ?", [TEST_HOSTNAME])
+    finally:
+        conn.close()
+
+
+def main():
+    logger.info("Testing the single-writer / many-reader concurrency model...")
+    rows_written = multiprocessing.Event()
+    release = multiprocessing.Event()
+    writer = multiprocessing.Process(target=writer_process, args=(rows_written, release))
+    writer.start()
+    try:
+        if not rows_written.wait(timeout=30):
+            logger.error("Concurrency test failed: writer never finished inserting.")
+            return False
+
+        # Phase 1: the writer still holds the file, so read-only connects
+        # must be refused -- this is why the collector keeps writes brief.
+        during = run_readers()
+    finally:
+        release.set()
+        writer.join()
+
+    # Phase 2: the writer has closed; readers attach and see the batch.
+    after = run_readers()
+    cleanup()
+
+    if all(result == "locked" for result in during) and all(result == 5 for result in after):
+        logger.info("Concurrency test passed: readers were locked out while the writer held "
+                    f"the file ({during}) and saw all 5 test rows after it closed ({after}).")
+        return True
+    logger.error(f"Concurrency test failed: during-write results {during} (expected all 'locked'), "
+                 f"after-write results {after} (expected all 5).")
+    return False
+
+
+if __name__ == "__main__":
+    main()